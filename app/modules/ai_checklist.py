@@ -1,5 +1,5 @@
 import os, re, json
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 CHECKLISTS = {
     "debridement": {
@@ -21,7 +21,11 @@ def _keyword_score(text: str, patterns: List[str]) -> float:
             score += 0.25
     return min(score, 0.95)
 
-def classify_with_gemini(text: str, labels: List[str]) -> Dict[str, float]:
+def classify_with_keywords(text: str, labels: List[str]) -> Dict[str, float]:
+    return {lab: _keyword_score(text, CHECKLISTS[lab]["keywords"]) for lab in labels}
+
+def classify_with_gemini(text: str, labels: List[str], strict: bool = False) -> Dict[str, float]:
+    """Gemini label probabilities; falls back to keywords unless strict, which raises instead."""
     api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
     try:
         import google.generativeai as genai  # type: ignore
@@ -37,13 +41,14 @@ def classify_with_gemini(text: str, labels: List[str]) -> Dict[str, float]:
         data = json.loads(content)
         out = {k: float(max(0.0, min(1.0, v))) for k,v in data.items() if k in labels}
         if out: return out
+        raise ValueError("Gemini returned no usable label probabilities")
     except Exception:
-        pass
-    return {lab: _keyword_score(text, CHECKLISTS[lab]["keywords"]) for lab in labels}
+        if strict: raise
+    return classify_with_keywords(text, labels)
 
-def detect_checklist(text: str) -> Tuple[str, float, Dict[str,float]]:
+def detect_checklist(text: str, classifier: Optional[Callable[[str, List[str]], Dict[str, float]]] = None) -> Tuple[str, float, Dict[str,float]]:
     labels = list(CHECKLISTS.keys())
-    dist = classify_with_gemini(text, labels)
+    dist = (classifier or classify_with_gemini)(text, labels)
     dist = {k: float(v) for k,v in dist.items() if k in labels}
     if not dist: return "", 0.0, {}
     top = sorted(dist.items(), key=lambda x: x[1], reverse=True)
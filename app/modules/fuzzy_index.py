@@ -0,0 +1,148 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Iterable, Tuple
+from collections import Counter
+import re
+
+@dataclass
+class FuzzyMatch:
+    term: str
+    source: str
+    targets: List[str]
+    matched: str
+    distance: int
+    similarity: float
+
+def normalize_term(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", (text or "").lower()).strip()
+
+def _ngrams(text: str, n: int) -> List[str]:
+    padded = " " + text + " "
+    if len(padded) < n: return [padded]
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+def edit_distance(a: str, b: str, max_distance: Optional[int] = None) -> int:
+    """Levenshtein distance; stops early once every cell exceeds max_distance."""
+    if a == b: return 0
+    if len(a) < len(b): a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance: return max_distance + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if max_distance is not None and min(cur) > max_distance: return max_distance + 1
+        prev = cur
+    return prev[-1]
+
+class NgramTermIndex:
+    """Character n-gram index over PCS index titles and key synonyms.
+
+    Every normalized term and each of its words (min_token_len or longer) is a
+    searchable key; n-gram overlap picks candidates, edit distance ranks them.
+    Single-word queries of short_query_len characters or fewer use the stricter
+    short_* thresholds so "supine" does not become "spine".
+    Build once and share across queries.
+    """
+    def __init__(self, n: int = 3, min_similarity: float = 0.75, max_distance: int = 3,
+                 min_ngram_overlap: float = 0.3, min_token_len: int = 4, short_query_len: int = 7,
+                 short_min_similarity: float = 0.85, short_max_distance: int = 1):
+        self.n = n
+        self.min_similarity = min_similarity
+        self.max_distance = max_distance
+        self.short_query_len = short_query_len
+        self.short_min_similarity = short_min_similarity
+        self.short_max_distance = short_max_distance
+        self.min_ngram_overlap = min_ngram_overlap
+        self.min_token_len = min_token_len
+        self.entries: List[Tuple[str, str, List[str]]] = []
+        self._entry_keys: List[str] = []
+        self.keys: List[str] = []
+        self._key_ids: Dict[str, int] = {}
+        self._key_entries: List[List[int]] = []
+        self._key_grams: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._seen: set = set()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _key_id(self, key: str) -> int:
+        kid = self._key_ids.get(key)
+        if kid is None:
+            kid = len(self.keys)
+            self._key_ids[key] = kid
+            self.keys.append(key)
+            self._key_entries.append([])
+            grams = set(_ngrams(key, self.n))
+            self._key_grams.append(len(grams))
+            for g in grams:
+                self._postings.setdefault(g, []).append(kid)
+        return kid
+
+    def add(self, term: str, source: str, targets: Optional[List[str]] = None) -> None:
+        norm = normalize_term(term)
+        if not norm or (norm, source) in self._seen: return
+        self._seen.add((norm, source))
+        eid = len(self.entries)
+        self.entries.append((term.strip(), source, list(targets or [])))
+        self._entry_keys.append(norm)
+        keys = [norm] + [w for w in norm.split() if len(w) >= self.min_token_len and w != norm]
+        for key in dict.fromkeys(keys):
+            self._key_entries[self._key_id(key)].append(eid)
+
+    def add_many(self, terms: Iterable[str], source: str) -> None:
+        for t in terms: self.add(t, source)
+
+    def add_key_map(self, key_map: Dict[str, List[str]], source: str) -> None:
+        for term, targets in key_map.items():
+            self.add(term, source, targets if isinstance(targets, list) else [targets])
+
+    def search(self, query: str, max_results: int = 10, min_similarity: Optional[float] = None,
+               max_distance: Optional[int] = None, sources: Optional[Iterable[str]] = None,
+               whole_terms: bool = False) -> List[FuzzyMatch]:
+        q = normalize_term(query)
+        if not q: return []
+        short = " " not in q and len(q) <= self.short_query_len
+        min_sim = min_similarity if min_similarity is not None else (
+            self.short_min_similarity if short else self.min_similarity)
+        max_d = max_distance if max_distance is not None else (
+            self.short_max_distance if short else self.max_distance)
+        allowed = set(sources) if sources else None
+
+        grams = set(_ngrams(q, self.n))
+        overlap: Counter = Counter()
+        for g in grams:
+            overlap.update(self._postings.get(g, ()))
+        shortlist = []
+        for kid, shared in overlap.items():
+            dice = 2.0 * shared / (len(grams) + self._key_grams[kid])
+            if dice < self.min_ngram_overlap: continue
+            if abs(len(self.keys[kid]) - len(q)) > max_d: continue
+            shortlist.append((dice, kid))
+        shortlist.sort(reverse=True)
+
+        best: Dict[int, Tuple[int, float, str]] = {}
+        for _, kid in shortlist[:200]:
+            key = self.keys[kid]
+            dist = edit_distance(q, key, max_d)
+            if dist > max_d: continue
+            sim = 1.0 - dist / max(len(q), len(key))
+            if sim < min_sim: continue
+            for eid in self._key_entries[kid]:
+                if whole_terms and self._entry_keys[eid] != key: continue
+                prev = best.get(eid)
+                if prev is None or (dist, -sim) < (prev[0], -prev[1]):
+                    best[eid] = (dist, sim, key)
+
+        ranked = sorted(best.items(), key=lambda kv: (kv[1][0], -kv[1][1],
+                                                      self._entry_keys[kv[0]] != kv[1][2],
+                                                      len(self.entries[kv[0]][0]), kv[0]))
+        out: List[FuzzyMatch] = []
+        for eid, (dist, sim, key) in ranked:
+            term, source, targets = self.entries[eid]
+            if allowed is not None and source not in allowed: continue
+            out.append(FuzzyMatch(term=term, source=source, targets=targets, matched=key,
+                                  distance=dist, similarity=round(sim, 3)))
+            if len(out) >= max_results: break
+        return out
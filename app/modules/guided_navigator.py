@@ -1,9 +1,10 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from typing import List, Dict, Optional, Tuple, Any
-import json
+import json, re
 
 from index_loader import PCSIndex
+from fuzzy_index import FuzzyMatch, NgramTermIndex
 from tables_loader import PCSTables, TableRow, PCSTable
 from rules_engine import RulesEngine
 
@@ -13,10 +14,18 @@ class GuidedCandidate:
     labels: Dict[str, str]
     rationale: List[str]
 
+def _fuzzy_key_targets(term_index: Optional[NgramTermIndex], term: str, source: str) -> List[str]:
+    # One edit at most: a looser match can swap the site itself (femoral → temporal artery)
+    if not term_index: return []
+    matches = term_index.search(term, max_results=1, sources=[source], whole_terms=True, max_distance=1)
+    return matches[0].targets if matches else []
+
 class DeviceResolver:
-    def __init__(self, key_map: Dict[str, List[str]], agg_rows: List[Dict[str, Any]]):
+    def __init__(self, key_map: Dict[str, List[str]], agg_rows: List[Dict[str, Any]],
+                 term_index: Optional[NgramTermIndex] = None):
         self.key_map = {k.lower(): v for k, v in key_map.items()}
         self.agg = agg_rows
+        self.term_index = term_index
     def normalize_terms(self, raw: Optional[str]) -> List[str]:
         if not raw: return []
         terms = [s.strip() for s in raw.split("/") if s.strip()]
@@ -24,7 +33,7 @@ class DeviceResolver:
         for t in terms:
             tl = t.lower()
             if tl in self.key_map: out.extend(self.key_map[tl])
-            else: out.append(t)
+            else: out.extend(_fuzzy_key_targets(self.term_index, t, "device_key") or [t])
         seen = set(); final = []
         for x in out:
             if x not in seen:
@@ -35,9 +44,11 @@ class DeviceResolver:
         op_l = (operation_label or "").lower()
         bs = body_system_code
         for row in self.agg:
-            if row.get("device") != device_value: continue
-            parents = [row.get("parent")] if isinstance(row.get("parent"), str) else (row.get("parent") or [])
-            ops = row.get("operations") or []
+            if (row.get("device") or row.get("specific_device")) != device_value: continue
+            parent = row.get("parent") or row.get("general_device")
+            parents = [parent] if isinstance(parent, str) else (parent or [])
+            ops = row.get("operations") or row.get("operation") or []
+            if isinstance(ops, str): ops = [ops]
             bsys = row.get("body_systems") or []
             op_ok = (not ops) or ("All applicable" in ops) or any((o or "").lower() in op_l for o in ops)
             bs_ok = (not bsys) or (bs is None) or (bs in bsys)
@@ -48,13 +59,15 @@ class DeviceResolver:
         return results
 
 class BodyPartResolver:
-    def __init__(self, key_map: Dict[str, List[str]]):
+    def __init__(self, key_map: Dict[str, List[str]], term_index: Optional[NgramTermIndex] = None):
         self.key_map = {k.lower(): v for k, v in key_map.items()}
+        self.term_index = term_index
     def resolve_allowed_labels(self, anatomy_terms: List[str]) -> List[str]:
         allowed: List[str] = []
         for term in anatomy_terms or []:
             tl = (term or "").lower()
             if tl in self.key_map: allowed.extend(self.key_map[tl])
+            else: allowed.extend(_fuzzy_key_targets(self.term_index, tl, "body_part_key"))
         seen = set(); out = []
         for a in allowed:
             al = a.lower()
@@ -65,21 +78,24 @@ class BodyPartResolver:
 class GuidedNavigator:
     def __init__(self, index_xml: str, tables_xml: str, rules_engine: RulesEngine,
                  device_key_json: Optional[str] = None, device_agg_json: Optional[str] = None,
-                 body_part_key_json: Optional[str] = None):
+                 body_part_key_json: Optional[str] = None, fuzzy_options: Optional[Dict[str, Any]] = None):
         self.index = PCSIndex(index_xml)
         self.tables = PCSTables(tables_xml)
         self.rules_engine = rules_engine
         self.device_resolver: Optional[DeviceResolver] = None
+        key_map: Dict[str, List[str]] = {}
         if device_key_json and device_agg_json:
             try:
                 key_map = json.load(open(device_key_json, "r", encoding="utf-8"))
                 agg_rows = json.load(open(device_agg_json, "r", encoding="utf-8"))
                 if "data" in key_map: key_map = key_map["data"]
                 if "data" in agg_rows: agg_rows = agg_rows["data"]
+                elif "records" in agg_rows: agg_rows = agg_rows["records"]
                 self.device_resolver = DeviceResolver(key_map, agg_rows)
             except Exception:
                 self.device_resolver = None
         self.body_part_resolver: Optional[BodyPartResolver] = None
+        bp_map: Dict[str, List[str]] = {}
         if body_part_key_json:
             try:
                 bp_map = json.load(open(body_part_key_json, "r", encoding="utf-8"))
@@ -87,6 +103,13 @@ class GuidedNavigator:
                 self.body_part_resolver = BodyPartResolver(bp_map)
             except Exception:
                 self.body_part_resolver = None
+        # Shared n-gram index for typo-tolerant lookups, built once per navigator.
+        self.term_index = self.index.build_term_index(
+            {"body_part_key": bp_map if self.body_part_resolver else {},
+             "device_key": key_map if self.device_resolver else {}},
+            **(fuzzy_options or {}))
+        if self.device_resolver: self.device_resolver.term_index = self.term_index
+        if self.body_part_resolver: self.body_part_resolver.term_index = self.term_index
 
     def _score_operation_against_hints(self, op_label: str, mutations: List[dict], checklist: dict = None) -> int:
         op = (op_label or "").lower(); score = 0
@@ -102,6 +125,15 @@ class GuidedNavigator:
                     score += max(5 - i, 1); break
         return score
 
+    def _score_table_against_sites(self, table: PCSTable, site_terms: Optional[List[str]]) -> int:
+        # Rank tables whose body parts mention the note's anatomy ("foot" → Skin, Left Foot); never filters
+        score = 0
+        for term in site_terms or []:
+            rx = re.compile(r"\b" + re.escape(term.lower()))
+            if any(rx.search(l.lower()) for row in table.rows for l in row.pos4.labels.values()):
+                score += 3
+        return score
+
     def _match_label(self, label: str, want: Optional[str]) -> bool:
         if not want: return True
         if not label: return False
@@ -143,17 +175,22 @@ class GuidedNavigator:
                 return (True, f"Device matched via key/aggregation: '{want_device_raw}' → {list(allowed_labels)}")
         return (False, f"Device '{want_device_raw}' not compatible with this table row")
 
-    def propose_codes(self, query: str, facts: Dict[str, any], limit: int = 25) -> Dict[str, any]:
+    def propose_codes(self, query: str, facts: Dict[str, any], limit: int = 25, fuzzy: bool = True) -> Dict[str, any]:
         outcome = self.rules_engine.apply(facts, tables_context=None)
         muts = outcome.mutations
 
-        hits = self.index.lookup(query, max_results=60)
-        prefixes = []; seen = set()
+        hits = self.index.lookup(query, max_results=60, follow_refs=True)
+        query_matches: List[FuzzyMatch] = []
+        if not hits and fuzzy:
+            hits, query_matches = self.index.fuzzy_lookup(query, max_results=60)
+        prefixes = []; seen = set(); ref_hints = {}
         for h in hits:
             for p in h.code_prefixes:
                 if len(p) >= 3 and p[0] == '0':
                     pref = p[:3]
-                    if pref not in seen: seen.add(pref); prefixes.append(pref)
+                    if pref not in seen:
+                        seen.add(pref); prefixes.append(pref)
+                        if h.device or h.qualifier: ref_hints[pref] = (h.device, h.qualifier)
 
         scored = []
         for pref in prefixes:
@@ -161,6 +198,7 @@ class GuidedNavigator:
             if not expansions: continue
             table, _ = expansions[0]
             s = self._score_operation_against_hints(table.operation_label, muts, facts.get('checklist') if isinstance(facts, dict) else None)
+            s += self._score_table_against_sites(table, facts.get("site_terms") if isinstance(facts, dict) else None)
             scored.append((s, pref, table.operation_label))
         scored.sort(reverse=True)
 
@@ -176,6 +214,10 @@ class GuidedNavigator:
 
         guided: List[GuidedCandidate] = []
         for _, pref, op_label in scored[:10]:
+            # "see Occlusion using Extraluminal Device": the reference fills in device/qualifier the facts left open
+            ref_device, ref_qual = ref_hints.get(pref, (None, None))
+            p_device = want_device or ref_device
+            p_qual = want_qual or ref_qual
             for table, row in self.tables.expand_from_prefix(pref):
                 for c4, l4 in row.pos4.labels.items():
                     keep4, why4 = self._pos4_keep(l4, facts)
@@ -186,16 +228,17 @@ class GuidedNavigator:
                         if req_appr and not self._match_label(l5, req_appr): continue
                         if not self._match_label(l5, want_approach): continue
                         for c6, l6 in row.pos6.labels.items():
-                            keep6, why6 = self._device_label_match(table, row, l6, want_device, muts)
+                            keep6, why6 = self._device_label_match(table, row, l6, p_device, muts)
                             if not keep6: continue
                             for c7, l7 in row.pos7.labels.items():
-                                if want_qual and not self._match_label(l7, want_qual): continue
+                                if p_qual and not self._match_label(l7, p_qual): continue
                                 code = pref + c4 + c5 + c6 + c7
                                 rationale = []
                                 if why4: rationale.append(why4)
-                                if want_qual: rationale.append(f"Qualifier matched '{want_qual}'")
+                                if p_qual: rationale.append(f"Qualifier matched '{p_qual}'")
                                 if want_approach: rationale.append(f"Approach matched '{want_approach}'")
                                 if why6: rationale.append(why6)
+                                if ref_device and not want_device: rationale.append(f"Device from index reference '{ref_device}'")
                                 rationale.append(f"Operation prioritized as '{op_label}'")
                                 guided.append(GuidedCandidate(code7=code, labels={
                                     "pos4": l4, "pos5": l5, "pos6": l6, "pos7": l7, "operation": op_label
@@ -203,7 +246,9 @@ class GuidedNavigator:
                                 if len(guided) >= limit:
                                     return {"prefixes_considered": [p for _, p, _ in scored[:10]],
                                             "candidates": [g.__dict__ for g in guided],
-                                            "mutations": muts, "actions": outcome.actions}
+                                            "mutations": muts, "actions": outcome.actions,
+                                            "query_matches": [m.__dict__ for m in query_matches]}
         return {"prefixes_considered": [p for _, p, _ in scored[:10]],
                 "candidates": [g.__dict__ for g in guided],
-                "mutations": muts, "actions": outcome.actions}
+                "mutations": muts, "actions": outcome.actions,
+                "query_matches": [m.__dict__ for m in query_matches]}
@@ -1,19 +1,46 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List
+from typing import List, Dict, Optional, Tuple
 import xml.etree.ElementTree as ET
 import re
 
+from fuzzy_index import NgramTermIndex, FuzzyMatch, normalize_term
+
 @dataclass
 class IndexHit:
     term_path: List[str]
     kind: str
     value: str
     code_prefixes: List[str]
+    device: Optional[str] = None
+    qualifier: Optional[str] = None
 
 class PCSIndex:
     def __init__(self, xml_path: str):
         self.root = ET.parse(xml_path).getroot()
+        self.term_index: Optional[NgramTermIndex] = None
+        self._main_terms: Dict[str, List[ET.Element]] = {}
+        # normalized title → (node, term path) for every main term and subterm, walked directly by fuzzy_lookup
+        self._title_nodes: Dict[str, List[Tuple[ET.Element, List[str]]]] = {}
+        for main in self.root.iter("mainTerm"):
+            mt = (main.findtext("title") or "").strip()
+            if not mt: continue
+            self._main_terms.setdefault(mt.lower(), []).append(main)
+            self._title_nodes.setdefault(normalize_term(mt), []).append((main, [mt]))
+            for term in main.findall(".//term"):
+                ttitle = (term.findtext("title") or "").strip()
+                if ttitle: self._title_nodes.setdefault(normalize_term(ttitle), []).append((term, [mt, ttitle]))
+
+    def titles(self) -> List[str]:
+        return [nodes[0][1][-1] for nodes in self._title_nodes.values()]
+
+    def build_term_index(self, key_maps: Optional[Dict[str, Dict[str, List[str]]]] = None, **options) -> NgramTermIndex:
+        idx = NgramTermIndex(**options)
+        idx.add_many(self.titles(), "index")
+        for source, key_map in (key_maps or {}).items():
+            if key_map: idx.add_key_map(key_map, source)
+        self.term_index = idx
+        return idx
 
     def _extract_codes(self, text: str) -> List[str]:
         if not text: return []
@@ -30,7 +57,55 @@ class PCSIndex:
             hits.extend(self._walk(term, path + ([ttitle] if ttitle else [])))
         return hits
 
-    def lookup(self, query: str, max_results: int = 50) -> List[IndexHit]:
+    def _follow_reference(self, ref: IndexHit, max_results: int) -> List[IndexHit]:
+        # "see Excision" / "see Occlusion using Extraluminal Device" / "see Excision with qualifier Diagnostic":
+        # walk the referenced main term, one hit per new 3-char prefix, carrying the device/qualifier along
+        value, device, qualifier = ref.value or "", None, None
+        if ref.kind == "see":
+            m = re.match(r"(.*?)\s+(?:using\s+(.+)|with device\s+(.+)|with qualifier\s+(.+))$", value)
+            if m: value, device, qualifier = m.group(1), m.group(2) or m.group(3), m.group(4)
+        hits: List[IndexHit] = []
+        seen = set()
+        for main in self._main_terms.get(value.split(",")[0].strip().lower(), []):
+            mt = (main.findtext("title") or "").strip()
+            for h in self._walk(main, [mt]):
+                prefs = {p[:3] for p in h.code_prefixes if p[0] == "0" and len(p) >= 3}
+                if not prefs or prefs <= seen: continue
+                seen |= prefs
+                h.device, h.qualifier = device, qualifier
+                hits.append(h)
+                if len(hits) >= max_results: return hits
+        return hits
+
+    def _with_references(self, hits: List[IndexHit], max_results: int) -> List[IndexHit]:
+        # Entries like "Debridement → see Excision" carry no codes; follow each reference with its own budget
+        if any(p[0] == "0" for h in hits for p in h.code_prefixes): return hits
+        refs: List[IndexHit] = []
+        for h in hits:
+            if h.kind in ("see", "use"): refs.extend(self._follow_reference(h, max_results))
+        return self._dedupe(hits + refs)
+
+    def _dedupe(self, results: List[IndexHit]) -> List[IndexHit]:
+        uniq = []
+        seen = set()
+        for h in results:
+            key = (tuple(h.term_path), h.kind, h.value)
+            if key not in seen:
+                seen.add(key); uniq.append(h)
+        return uniq
+
+    def fuzzy_lookup(self, query: str, max_results: int = 50, max_terms: int = 3,
+                     **thresholds) -> Tuple[List[IndexHit], List[FuzzyMatch]]:
+        """Walk the index nodes of the closest titles from the n-gram term index, following see/use references."""
+        if self.term_index is None: self.build_term_index()
+        matches = self.term_index.search(query, max_results=max_terms, sources=["index"], **thresholds)
+        results: List[IndexHit] = []
+        for m in matches:
+            for node, path in self._title_nodes.get(normalize_term(m.term), []):
+                results.extend(self._walk(node, path))
+        return self._with_references(self._dedupe(results)[:max_results], max_results), matches
+
+    def lookup(self, query: str, max_results: int = 50, follow_refs: bool = False) -> List[IndexHit]:
         q = (query or "").strip().lower()
         if not q: return []
         results: List[IndexHit] = []
@@ -44,10 +119,5 @@ class PCSIndex:
                     ttitle = (term.findtext("title") or "").strip()
                     if ttitle and q in ttitle.lower():
                         results.extend(self._walk(term, path0 + [ttitle]))
-        uniq = []
-        seen = set()
-        for h in results:
-            key = (tuple(h.term_path), h.kind, h.value)
-            if key not in seen:
-                seen.add(key); uniq.append(h)
-        return uniq[:max_results]
+        uniq = self._dedupe(results)[:max_results]
+        return self._with_references(uniq, max_results) if follow_refs else uniq
@@ -0,0 +1,136 @@
+from __future__ import annotations
+from typing import List, Dict, Optional, Any, Callable
+import re
+
+from ai_checklist import detect_checklist
+from checklist_loader import load_constraints
+from fuzzy_index import edit_distance
+
+GENERIC_QUERIES = ("procedure", "operative", "operation", "surgery")
+
+def auto_facts(text: str) -> dict:
+    t = (text or "").lower()
+    flags = []
+    if "biopsy" in t: flags.append("biopsy")
+    if "drain left in place" in t or "jp drain" in t: flags.append("drain left in place")
+    if "removed at end" in t or "no device left" in t: flags.append("removed at end")
+
+    # Approach
+    approach = None
+    for rx, label in [
+        (r"\bpercutaneous endoscopic\b", "Percutaneous Endoscopic"),
+        (r"\bpercutaneous\b", "Percutaneous"),
+        (r"via natural or artificial opening with percutaneous endoscopic assistance", "Via Natural or Artificial Opening With Percutaneous Endoscopic Assistance"),
+        (r"via natural or artificial opening endoscopic", "Via Natural or Artificial Opening Endoscopic"),
+        (r"\bvia natural or artificial opening\b", "Via Natural or Artificial Opening"),
+        (r"\bopen\b", "Open"),
+        (r"\bexternal\b", "External"),
+    ]:
+        if re.search(rx, t): approach = label; break
+
+    # Device
+    device = None
+    if "no device left" in t or "removed at end" in t:
+        device = "No Device"
+    elif "stent" in t or "implant" in t or "catheter" in t:
+        device = "Stent"
+
+    # Strong terms
+    strong_terms = [
+        ("excisional debridement", "debridement"),
+        ("irrigation and debridement", "debridement"),
+        ("incision & drainage", "incision and drainage"),
+        ("incision and drainage", "incision and drainage"),
+        ("i & d", "incision and drainage"),
+        ("biopsy", "biopsy"),
+        ("excision", "excision"),
+        ("resection", "resection"),
+        ("debridement", "debridement"),
+    ]
+    query, query_source = None, "term"
+    for needle, q in strong_terms:
+        if needle in t:
+            query = q; break
+    if not query:
+        query = _fuzzy_strong_term(t, strong_terms)
+        query_source = "fuzzy_term"
+
+    anatomy_terms = []
+    for organ in ["groin","thigh","skin","subcutaneous","soft tissue","arm","leg","hand","foot","abdomen","chest","back",
+                  "artery","aorta","vein"]:
+        if organ in t: anatomy_terms.append(organ)
+
+    if not query:
+        m = re.search(r"\b([a-z]{5,})\b", t)
+        query = m.group(1) if m else "procedure"
+        query_source = "fallback"
+
+    return {"raw_text_flags": flags, "approach_name": approach, "device_name": device,
+            "index_query": query, "index_query_source": query_source, "anatomy_terms": anatomy_terms}
+
+def _is_typo_of(word: str, needle: str, max_d: int) -> bool:
+    if word[0] != needle[0]: return False
+    if max_d > 1: return edit_distance(word, needle, max_d) <= max_d
+    # One edit on short needles: a dropped/extra letter or two swapped neighbours, never a substitution
+    # (substitutions turn real words into needles: "rejection" → "resection")
+    if len(word) == len(needle):
+        diff = [i for i, (a, b) in enumerate(zip(word, needle)) if a != b]
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and word[diff[0]] == needle[diff[1]] and word[diff[1]] == needle[diff[0]]
+    return abs(len(word) - len(needle)) == 1 and edit_distance(word, needle, 1) == 1
+
+def _fuzzy_strong_term(t: str, strong_terms: List[tuple]) -> Optional[str]:
+    # Misspelled strong terms ("debridment"): one edit, two for needles of 10+ characters
+    tokens = re.findall(r"[a-z]+", t)
+    by_first: Dict[str, List[int]] = {}
+    for i, tok in enumerate(tokens):
+        by_first.setdefault(tok[0], []).append(i)
+    for needle, q in strong_terms:
+        words = re.findall(r"[a-z]+", needle)
+        phrase = " ".join(words)
+        if len(phrase) < 6: continue
+        max_d = 2 if len(phrase) >= 10 else 1
+        tried = set()
+        for i in by_first.get(phrase[0], []):
+            if abs(len(tokens[i]) - len(words[0])) > max_d: continue
+            window = " ".join(tokens[i:i + len(words)])
+            if window in tried or abs(len(window) - len(phrase)) > max_d: continue
+            tried.add(window)
+            if _is_typo_of(window, phrase, max_d): return q
+    return None
+
+def use_fuzzy(facts: dict, query: str) -> bool:
+    """No approximate index search for the first-long-word fallback unless the user typed a query."""
+    return facts.get("index_query_source") != "fallback" or query != facts.get("index_query")
+
+def default_query(facts: dict, constraints: dict) -> str:
+    query = facts.get("index_query", "")
+    # If a checklist was picked and the query looks generic, steer to a label that resolves in the index
+    if constraints and query in GENERIC_QUERIES:
+        query = "debridement"
+    return query
+
+def build_facts(query: str, flags: List[str], constraints: dict,
+                approach: Optional[str] = None, device: Optional[str] = None,
+                site_terms: Optional[List[str]] = None) -> Dict[str, Any]:
+    return {
+        "raw_text_flags": flags,
+        "anatomy_terms": [query] if query else [],
+        "site_terms": site_terms or [],
+        "checklist": constraints or {},
+        "approach_name": approach or None,
+        "device_name": device or None
+    }
+
+def run_note(nav, text: str, use_ai: bool = True, limit: int = 50,
+             classifier: Optional[Callable[[str, List[str]], Dict[str, float]]] = None) -> Dict[str, Any]:
+    """Non-interactive pass over one note, taking the UI defaults (top checklist, no overrides)."""
+    facts = auto_facts(text)
+    label, conf, dist = detect_checklist(text, classifier=classifier) if use_ai else ("", 0.0, {})
+    if use_ai and not label and dist:
+        label = sorted(dist.items(), key=lambda x: x[1], reverse=True)[0][0]
+    constraints = load_constraints(label) if label else {}
+    query = default_query(facts, constraints) or "procedure"
+    full_facts = build_facts(query, facts.get("raw_text_flags", []), constraints,
+                             facts.get("approach_name"), facts.get("device_name"), facts.get("anatomy_terms"))
+    res = nav.propose_codes(query, full_facts, limit=limit, fuzzy=use_fuzzy(facts, query))
+    return {"facts": facts, "checklist": label, "checklist_dist": dist, "query": query, "result": res}
@@ -0,0 +1,213 @@
+"""Replay a golden corpus of coded notes through the pipeline and score it.
+
+Corpus layout: one ``<note_id>.txt`` (or ``.md``) per note with a sidecar
+``<note_id>.json`` holding ``{"expected_codes": ["0HBJXZZ", ...]}``.
+
+    python app/modules/replay.py run corpus/ --out base.json
+    python app/modules/replay.py run corpus/ --out new.json --backend recorded.json
+    python app/modules/replay.py diff base.json new.json --fail-on-change
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Any, Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+import argparse, hashlib, json, os, statistics, sys, time
+
+from ai_checklist import classify_with_keywords, classify_with_gemini
+from rules_registry import init as defs_init
+from rules_engine import RulesEngine
+from guided_navigator import GuidedNavigator
+from pipeline import run_note
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
+DEFAULT_KS = (1, 5, 10)
+
+@dataclass
+class GoldenNote:
+    note_id: str
+    text: str
+    expected: List[str]
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class RecordedClassifier:
+    """Replays checklist distributions captured by ``run --backend live --record``.
+
+    A note without a recording raises KeyError rather than mixing in another backend.
+    """
+    def __init__(self, path: str):
+        self.recorded: Dict[str, Dict[str, float]] = json.load(open(path, "r", encoding="utf-8"))
+    def __call__(self, text: str, labels: List[str]) -> Dict[str, float]:
+        dist = self.recorded.get(text_key(text))
+        if dist is None:
+            raise KeyError(f"No recorded checklist output for note {text_key(text)[:12]}; "
+                           "re-record with --backend live --record")
+        return {k: float(v) for k, v in dist.items() if k in labels}
+
+def classify_live(text: str, labels: List[str]) -> Dict[str, float]:
+    # Strict: a missing key or API failure aborts the run instead of recording keyword scores as model output
+    return classify_with_gemini(text, labels, strict=True)
+
+def make_classifier(backend: str) -> Callable[[str, List[str]], Dict[str, float]]:
+    if backend == "stub": return classify_with_keywords
+    if backend == "live": return classify_live
+    if os.path.isfile(backend): return RecordedClassifier(backend)
+    raise ValueError(f"Unknown backend '{backend}': use 'stub', 'live' or a recording JSON path")
+
+def build_navigator(data_dir: str = DATA_DIR) -> GuidedNavigator:
+    p = lambda name: os.path.join(data_dir, name)
+    defs_init(p("icd10pcs_definitions_2025.xml"))
+    rules = json.load(open(p("pcs_guidelines_rules_2025.json"), "r", encoding="utf-8"))
+    return GuidedNavigator(p("icd10pcs_index_2025.xml"), p("icd10pcs_tables_2025.xml"), RulesEngine(rules),
+                           device_key_json=p("device_key.json"), device_agg_json=p("device_aggregation.json"),
+                           body_part_key_json=p("body_part_key.json"))
+
+def load_corpus(corpus_dir: str) -> List[GoldenNote]:
+    notes: List[GoldenNote] = []
+    for name in sorted(os.listdir(corpus_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in (".txt", ".md"): continue
+        sidecar = os.path.join(corpus_dir, stem + ".json")
+        if not os.path.isfile(sidecar): continue
+        meta = json.load(open(sidecar, "r", encoding="utf-8"))
+        text = open(os.path.join(corpus_dir, name), "r", encoding="utf-8", errors="ignore").read()
+        notes.append(GoldenNote(stem, text, [c.strip().upper() for c in meta.get("expected_codes") or []]))
+    return notes
+
+def precision_recall_at_k(predicted: Sequence[str], expected: Sequence[str], k: int) -> Dict[str, float]:
+    """Standard P@k (hits in the top k / k) and R@k (hits in the top k / expected codes)."""
+    hits = len(set(predicted[:k]) & set(expected))
+    return {"precision": hits / k if k else 0.0,
+            "recall": hits / len(set(expected)) if expected else 0.0}
+
+_WORKER: Dict[str, Any] = {}
+
+def _init_worker(backend: str, data_dir: str) -> None:
+    _WORKER["nav"] = build_navigator(data_dir)
+    _WORKER["classifier"] = make_classifier(backend)
+
+def _replay_one(note: GoldenNote, ks: Sequence[int], limit: int) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    out = run_note(_WORKER["nav"], note.text, limit=limit, classifier=_WORKER["classifier"])
+    latency_ms = (time.perf_counter() - t0) * 1000.0
+    predicted = [c["code7"] for c in out["result"].get("candidates", [])]
+    return {"note_id": note.note_id, "text_sha256": text_key(note.text), "expected": note.expected,
+            "predicted": predicted, "checklist": out["checklist"], "checklist_dist": out["checklist_dist"],
+            "query": out["query"], "latency_ms": round(latency_ms, 3),
+            "metrics": {str(k): precision_recall_at_k(predicted, note.expected, k) for k in ks}}
+
+def summarize(notes: List[Dict[str, Any]], ks: Sequence[int]) -> Dict[str, Any]:
+    lat = sorted(n["latency_ms"] for n in notes)
+    summary: Dict[str, Any] = {"notes": len(notes), "metrics": {}}
+    for k in ks:
+        rows = [n["metrics"][str(k)] for n in notes]
+        summary["metrics"][str(k)] = {
+            "precision": round(statistics.fmean(r["precision"] for r in rows), 4) if rows else 0.0,
+            "recall": round(statistics.fmean(r["recall"] for r in rows), 4) if rows else 0.0}
+    if lat:
+        summary["latency_ms"] = {"mean": round(statistics.fmean(lat), 3),
+                                 "p50": round(statistics.median(lat), 3),
+                                 "p95": round(statistics.quantiles(lat, n=20, method="inclusive")[18]
+                                              if len(lat) > 1 else lat[0], 3),
+                                 "max": round(lat[-1], 3)}
+    return summary
+
+def run_corpus(corpus_dir: str, backend: str = "stub", workers: Optional[int] = None,
+               ks: Sequence[int] = DEFAULT_KS, limit: int = 50, data_dir: str = DATA_DIR) -> Dict[str, Any]:
+    notes = load_corpus(corpus_dir)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(notes) or 1))
+    t0 = time.perf_counter()
+    if workers == 1:
+        _init_worker(backend, data_dir)
+        results = [_replay_one(n, ks, limit) for n in notes]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(backend, data_dir)) as pool:
+            results = list(pool.map(_replay_one, notes, [ks] * len(notes), [limit] * len(notes)))
+    return {"corpus": os.path.abspath(corpus_dir), "backend": backend, "workers": workers,
+            "ks": list(ks), "limit": limit, "wall_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+            "summary": summarize(results, ks), "notes": results}
+
+def diff_runs(base: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    a = {n["note_id"]: n for n in base["notes"]}
+    b = {n["note_id"]: n for n in new["notes"]}
+    changed, checklist_only, latency = [], [], {}
+    for nid in sorted(set(a) & set(b)):
+        checklists = [a[nid]["checklist"], b[nid]["checklist"]]
+        if a[nid]["predicted"] != b[nid]["predicted"]:
+            pa, pb = set(a[nid]["predicted"]), set(b[nid]["predicted"])
+            changed.append({"note_id": nid, "checklist": checklists,
+                            "added": sorted(pb - pa), "removed": sorted(pa - pb), "reordered": pa == pb})
+        elif checklists[0] != checklists[1]:
+            checklist_only.append({"note_id": nid, "checklist": checklists})
+        latency[nid] = round(b[nid]["latency_ms"] - a[nid]["latency_ms"], 3)
+    metrics = {}
+    for k, m in new["summary"]["metrics"].items():
+        old = base["summary"]["metrics"].get(k)
+        if old:
+            metrics[k] = {name: round(m[name] - old[name], 4) for name in ("precision", "recall")}
+    lat_a, lat_b = base["summary"].get("latency_ms", {}), new["summary"].get("latency_ms", {})
+    return {"only_in_base": sorted(set(a) - set(b)), "only_in_new": sorted(set(b) - set(a)),
+            "changed": changed, "checklist_only": checklist_only, "metrics_delta": metrics,
+            "latency_delta_ms": {s: round(lat_b[s] - lat_a[s], 3) for s in lat_b if s in lat_a},
+            "per_note_latency_delta_ms": latency}
+
+def _print_run(run: Dict[str, Any]) -> None:
+    s = run["summary"]
+    print(f"{s['notes']} notes, backend={run['backend']}, workers={run['workers']}, wall {run['wall_ms']:.0f} ms")
+    for k, m in s["metrics"].items():
+        print(f"  @{k}: precision {m['precision']:.3f}  recall {m['recall']:.3f}")
+    print("  (P@k = correct codes in the top k / k; R@k = correct codes in the top k / expected codes)")
+    if "latency_ms" in s:
+        print("  latency ms: " + "  ".join(f"{name} {v:.1f}" for name, v in s["latency_ms"].items()))
+
+def _print_diff(d: Dict[str, Any]) -> None:
+    for k, m in d["metrics_delta"].items():
+        print(f"  @{k}: precision {m['precision']:+.4f}  recall {m['recall']:+.4f}")
+    if d["latency_delta_ms"]:
+        print("  latency delta ms: " + "  ".join(f"{name} {v:+.1f}" for name, v in d["latency_delta_ms"].items()))
+    for nid in d["only_in_base"]: print(f"  - {nid} (missing from new run)")
+    for nid in d["only_in_new"]: print(f"  + {nid} (new in this run)")
+    for c in d["changed"]:
+        what = "reordered" if c["reordered"] else f"+{c['added']} -{c['removed']}"
+        print(f"  ~ {c['note_id']}: {what}" + (f" checklist {c['checklist'][0]!r}→{c['checklist'][1]!r}"
+                                                if c["checklist"][0] != c["checklist"][1] else ""))
+    for c in d["checklist_only"]:
+        print(f"  ? {c['note_id']}: same codes, checklist {c['checklist'][0]!r}→{c['checklist'][1]!r}")
+    print(f"{len(d['changed'])} note(s) changed results, {len(d['checklist_only'])} changed checklist only")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Replay a golden corpus through the PCS pipeline.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="replay a corpus directory")
+    r.add_argument("corpus")
+    r.add_argument("--out", help="write the run (per-note results + summary) as JSON")
+    r.add_argument("--backend", default="stub", help="'stub' (keywords), 'live' (Gemini) or a recording JSON")
+    r.add_argument("--record", help="write the checklist distributions seen in this run for later replay")
+    r.add_argument("--workers", type=int, default=None)
+    r.add_argument("--k", type=int, nargs="+", default=list(DEFAULT_KS))
+    r.add_argument("--limit", type=int, default=50)
+    d = sub.add_parser("diff", help="compare two saved runs")
+    d.add_argument("base"); d.add_argument("new")
+    d.add_argument("--fail-on-change", action="store_true", help="exit 1 if any note's codes changed")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "run":
+        run = run_corpus(args.corpus, backend=args.backend, workers=args.workers, ks=args.k, limit=args.limit)
+        _print_run(run)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(run, f, indent=2)
+        if args.record:
+            with open(args.record, "w", encoding="utf-8") as f:
+                json.dump({n["text_sha256"]: n["checklist_dist"] for n in run["notes"]}, f, indent=2)
+        return 0
+    base = json.load(open(args.base, "r", encoding="utf-8"))
+    new = json.load(open(args.new, "r", encoding="utf-8"))
+    result = diff_runs(base, new)
+    _print_diff(result)
+    return 1 if args.fail_on_change and (result["changed"] or result["only_in_base"] or result["only_in_new"]) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
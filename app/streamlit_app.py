@@ -17,6 +17,7 @@ from guided_navigator import GuidedNavigator
 from body_system_loader import load_body_systems_section0
 from ai_checklist import detect_checklist, CHECKLISTS
 from checklist_loader import load_constraints
+from pipeline import auto_facts, default_query, build_facts, use_fuzzy
 
 DEFS_XML   = os.path.join(DATA_DIR, "icd10pcs_definitions_2025.xml")
 INDEX_XML  = os.path.join(DATA_DIR, "icd10pcs_index_2025.xml")
@@ -59,63 +60,6 @@ def extract_text(file) -> str:
     except Exception: return ""
 
 
-def auto_facts(text: str) -> dict:
-    t = (text or "").lower()
-    flags = []
-    if "biopsy" in t: flags.append("biopsy")
-    if "drain left in place" in t or "jp drain" in t: flags.append("drain left in place")
-    if "removed at end" in t or "no device left" in t: flags.append("removed at end")
-
-    # Approach
-    approach = None
-    for rx, label in [
-        (r"\bpercutaneous endoscopic\b", "Percutaneous Endoscopic"),
-        (r"\bpercutaneous\b", "Percutaneous"),
-        (r"via natural or artificial opening with percutaneous endoscopic assistance", "Via Natural or Artificial Opening With Percutaneous Endoscopic Assistance"),
-        (r"via natural or artificial opening endoscopic", "Via Natural or Artificial Opening Endoscopic"),
-        (r"\bvia natural or artificial opening\b", "Via Natural or Artificial Opening"),
-        (r"\bopen\b", "Open"),
-        (r"\bexternal\b", "External"),
-    ]:
-        if re.search(rx, t): approach = label; break
-
-    # Device
-    device = None
-    if "no device left" in t or "removed at end" in t:
-        device = "No Device"
-    elif "stent" in t or "implant" in t or "catheter" in t:
-        device = "Stent"
-
-    # Strong terms
-    strong_terms = [
-        ("excisional debridement", "debridement"),
-        ("irrigation and debridement", "debridement"),
-        ("incision & drainage", "incision and drainage"),
-        ("incision and drainage", "incision and drainage"),
-        ("i & d", "incision and drainage"),
-        ("biopsy", "biopsy"),
-        ("excision", "excision"),
-        ("resection", "resection"),
-        ("debridement", "debridement"),
-    ]
-    query = None
-    for needle, q in strong_terms:
-        if needle in t:
-            query = q; break
-
-    anatomy_terms = []
-    for organ in ["groin","thigh","skin","subcutaneous","soft tissue","arm","leg","hand","foot","abdomen","chest","back"]:
-        if organ in t: anatomy_terms.append(organ)
-
-    if not query:
-        m = re.search(r"\b([a-z]{5,})\b", t)
-        query = m.group(1) if m else "procedure"
-
-    return {"raw_text_flags": flags, "approach_name": approach, "device_name": device,
-            "index_query": query, "anatomy_terms": anatomy_terms}
-
-
-
 st.markdown("### Upload Procedure Note (.pdf, .md, .txt)")
 uploaded = st.file_uploader("Upload", type=["pdf","md","txt"])
 
@@ -156,12 +100,7 @@ with c2:
     device_in = st.text_input("Device", value=(facts.get("device_name") or ""))
 with c3:
     flags_in = st.text_input("Flags", value=", ".join(facts.get("raw_text_flags", [])))
-query_default = facts.get("index_query","")
-# If AI picked a checklist and the query looks generic, steer to checklist title
-if constraints and (query_default in ("procedure","operative","operation","surgery")):
-    # Use a label that will resolve in index
-    if "debridement" in (constraints.get("root_op_priority") or []) or True:
-        query_default = "debridement"
+query_default = default_query(facts, constraints)
 query_in = st.text_input("Index Term", value=query_default)
 
 if st.button("Analyze & Propose PCS Codes", type="primary"):
@@ -170,16 +109,13 @@ if st.button("Analyze & Propose PCS Codes", type="primary"):
     else:
         flags = [x.strip() for x in re.split(r"[\n,;]+", flags_in) if x.strip()]
         query = query_in or facts.get("index_query") or "procedure"
-        full_facts = {
-            "raw_text_flags": flags,
-            "anatomy_terms": [query] if query else [],
-            "checklist": constraints or {},
-            "approach_name": approach_in or None,
-            "device_name": device_in or None
-        }
+        full_facts = build_facts(query, flags, constraints, approach_in, device_in, facts.get("anatomy_terms"))
         nav = st.session_state['nav']
-        res = nav.propose_codes(query, full_facts, limit=50)
+        res = nav.propose_codes(query, full_facts, limit=50, fuzzy=use_fuzzy(facts, query))
         st.caption(f"Prefixes considered: {', '.join(res.get('prefixes_considered', []))}")
+        if res.get("query_matches"):
+            st.caption("No exact index match — used approximate: " +
+                       ", ".join(f"{m['term']} ({m['similarity']:.2f})" for m in res["query_matches"]))
         cands = res.get("candidates", [])
         if not cands:
             st.warning("No candidates after filtering.")
@@ -0,0 +1,101 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app", "modules"))
+
+from fuzzy_index import NgramTermIndex, edit_distance
+
+def _index(**options):
+    idx = NgramTermIndex(**options)
+    idx.add_many(["Debridement", "Clipping, aneurysm", "Excision", "Excision of lesion", "Resection"], "index")
+    idx.add_key_map({"Achilles tendon": ["Lower Leg Tendon, Right", "Lower Leg Tendon, Left"]}, "body_part_key")
+    return idx
+
+def test_edit_distance():
+    assert edit_distance("debridment", "debridement") == 1
+    assert edit_distance("aneurism", "aneurysm") == 1
+    assert edit_distance("abc", "abcdefgh", max_distance=2) == 3
+
+def test_misspelled_terms_rank_by_distance():
+    idx = _index()
+    assert idx.search("debridment")[0].term == "Debridement"
+    assert idx.search("aneurism")[0].term == "Clipping, aneurysm"
+    top = idx.search("excison")
+    assert [m.term for m in top] == ["Excision", "Excision of lesion"]
+    assert top[0].distance == 1
+
+def test_key_synonyms_and_sources():
+    idx = _index()
+    m = idx.search("achiles tendon", sources=["body_part_key"])[0]
+    assert m.term == "Achilles tendon" and m.targets[0] == "Lower Leg Tendon, Right"
+    assert idx.search("achiles tendon", sources=["index"]) == []
+
+def test_thresholds():
+    idx = _index()
+    assert idx.search("xyzzy") == []
+    assert idx.search("debridment", max_distance=0) == []
+    assert _index(min_similarity=0.95).search("debridment") == []
+
+def test_short_single_words_use_stricter_thresholds():
+    idx = NgramTermIndex()
+    idx.add_many(["Spine", "Excision"], "index")
+    assert idx.search("supine") == []
+    assert idx.search("excison")[0].term == "Excision"
+
+def test_whole_terms_only():
+    idx = _index()
+    assert idx.search("achiles", sources=["body_part_key"])[0].term == "Achilles tendon"
+    assert idx.search("achiles", sources=["body_part_key"], whole_terms=True) == []
+
+def test_auto_facts_recovers_misspelled_strong_term():
+    from pipeline import auto_facts, use_fuzzy
+    facts = auto_facts("Supine position. Debridment of left foot ulcer, open.")
+    assert facts["index_query"] == "debridement" and facts["index_query_source"] == "fuzzy_term"
+    facts = auto_facts("Acute graft rejection, detection of lesion.")
+    assert facts["index_query_source"] == "fallback"
+    for typo, q in [("resecton", "resection"), ("resectoin", "resection"), ("exision", "excision")]:
+        assert auto_facts(f"Colon {typo}.")["index_query"] == q
+    facts = auto_facts("Supine position, prepped and draped.")
+    assert facts["index_query"] == "supine" and not use_fuzzy(facts, "supine")
+    assert use_fuzzy(facts, "spine")
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+@pytest.fixture(scope="module")
+def nav():
+    from guided_navigator import GuidedNavigator
+    from rules_engine import RulesEngine
+    p = lambda name: os.path.join(DATA_DIR, name)
+    return GuidedNavigator(p("icd10pcs_index_2025.xml"), p("icd10pcs_tables_2025.xml"), RulesEngine({}),
+                           device_key_json=p("device_key.json"), device_agg_json=p("device_aggregation.json"),
+                           body_part_key_json=p("body_part_key.json"))
+
+def test_propose_codes_debridement_typo_reaches_skin_and_subcutaneous(nav):
+    from pipeline import auto_facts
+    facts = auto_facts("Debridment of skin and subcutaneous tissue, left foot ulcer.")
+    res = nav.propose_codes(facts["index_query"], {"raw_text_flags": [], "site_terms": facts["anatomy_terms"]}, limit=5)
+    assert facts["index_query"] == "debridement" and res["query_matches"] == []
+    assert {"0HB", "0JB", "0HD", "0JD"} <= set(res["prefixes_considered"][:4])
+    res = nav.propose_codes("debridment", {"raw_text_flags": [], "site_terms": ["skin", "subcutaneous", "foot"]}, limit=5)
+    assert res["query_matches"][0]["term"] == "Debridement"
+    assert res["candidates"][0]["code7"][:3] in ("0HB", "0HD", "0JB", "0JD")
+
+def test_propose_codes_aneurysm_typo_follows_both_references(nav):
+    res = nav.propose_codes("aneurism", {"raw_text_flags": [], "site_terms": ["artery"]}, limit=5)
+    assert res["query_matches"][0]["term"] == "Clipping, aneurysm"
+    assert {"03L", "03V", "04L", "04V"} <= set(res["prefixes_considered"][:4])
+    assert all(c["labels"]["pos6"] == "Extraluminal Device" for c in res["candidates"])
+
+def test_propose_codes_skips_fuzzy_when_exact_hits(nav):
+    res = nav.propose_codes("excision", {"raw_text_flags": []}, limit=5)
+    assert res["candidates"] and res["query_matches"] == []
+    res = nav.propose_codes("debridement", {"raw_text_flags": []}, limit=5)
+    assert res["candidates"] and res["query_matches"] == []
+
+def test_resolvers_fall_back_to_key_synonyms(nav):
+    assert "Lower Leg Tendon, Right" in nav.body_part_resolver.resolve_allowed_labels(["achiles tendon"])
+    assert nav.body_part_resolver.resolve_allowed_labels(["excision"]) == []
+    assert nav.body_part_resolver.resolve_allowed_labels(["superficial femoral artery"]) == []
+    assert nav.device_resolver.normalize_terms("CYPHER(R) Stnt") != ["CYPHER(R) Stnt"]
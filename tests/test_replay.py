@@ -0,0 +1,71 @@
+import json, os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app", "modules"))
+
+from replay import precision_recall_at_k, diff_runs, run_corpus, summarize, make_classifier, text_key
+
+def test_precision_recall_at_k():
+    m = precision_recall_at_k(["A", "B", "C"], ["B", "D"], 2)
+    assert m == {"precision": 0.5, "recall": 0.5}
+    assert precision_recall_at_k(["A"], ["A"], 10) == {"precision": 0.1, "recall": 1.0}
+    assert precision_recall_at_k([], ["A"], 5) == {"precision": 0.0, "recall": 0.0}
+
+def _note(nid, predicted, latency):
+    return {"note_id": nid, "predicted": predicted, "checklist": "", "latency_ms": latency,
+            "metrics": {"1": precision_recall_at_k(predicted, ["A"], 1)}}
+
+def test_diff_runs_reports_changes_and_deltas():
+    base_notes = [_note("n1", ["A", "B"], 10.0), _note("n2", ["C"], 20.0)]
+    new_notes = [_note("n1", ["B", "A"], 5.0), _note("n2", ["A"], 10.0)]
+    base = {"notes": base_notes, "summary": summarize(base_notes, [1])}
+    new = {"notes": new_notes, "summary": summarize(new_notes, [1])}
+    d = diff_runs(base, new)
+    assert [c["note_id"] for c in d["changed"]] == ["n1", "n2"]
+    assert d["changed"][0]["reordered"] and d["changed"][1]["added"] == ["A"]
+    assert d["metrics_delta"]["1"] == {"precision": 0.0, "recall": 0.0}
+    assert d["latency_delta_ms"]["max"] == -10.0
+    assert diff_runs(base, base)["changed"] == []
+
+def test_diff_runs_checklist_only_change_is_not_reordered():
+    base_notes = [_note("n1", ["A", "B"], 10.0)]
+    new_notes = [dict(_note("n1", ["A", "B"], 10.0), checklist="debridement")]
+    d = diff_runs({"notes": base_notes, "summary": summarize(base_notes, [1])},
+                  {"notes": new_notes, "summary": summarize(new_notes, [1])})
+    assert d["changed"] == []
+    assert d["checklist_only"] == [{"note_id": "n1", "checklist": ["", "debridement"]}]
+
+def test_summarize_latency_percentiles():
+    notes = [_note(f"n{i}", [], float(ms)) for i, ms in enumerate([10, 20, 30, 40])]
+    lat = summarize(notes, [1])["latency_ms"]
+    assert lat["p50"] == 25.0 and lat["max"] == 40.0 and 38.0 <= lat["p95"] <= 40.0
+    assert summarize(notes[:1], [1])["latency_ms"]["p95"] == 10.0
+
+def test_run_corpus_with_stub_backend(tmp_path):
+    (tmp_path / "n1.txt").write_text("Debridment of skin of left foot, external.")
+    (tmp_path / "n1.json").write_text(json.dumps({"expected_codes": ["0HB0XZZ", "0HBNXZZ"]}))
+    (tmp_path / "unlabelled.txt").write_text("No sidecar, skipped.")
+    run = run_corpus(str(tmp_path), backend="stub", workers=1, ks=[1, 5])
+    assert run["summary"]["notes"] == 1 and run["backend"] == "stub" and run["ks"] == [1, 5]
+    note = run["notes"][0]
+    assert note["note_id"] == "n1" and note["query"] == "debridement" and note["checklist"] == "debridement"
+    assert note["predicted"][:2] == ["0HB0XZX", "0HB0XZZ"]
+    assert note["metrics"] == {"1": {"precision": 0.0, "recall": 0.0}, "5": {"precision": 0.2, "recall": 0.5}}
+    assert run["summary"]["metrics"] == note["metrics"]
+    assert set(run["summary"]["latency_ms"]) == {"mean", "p50", "p95", "max"}
+    assert run["summary"]["latency_ms"]["p50"] == note["latency_ms"] > 0
+
+def test_recorded_backend_refuses_unrecorded_notes(tmp_path):
+    rec = tmp_path / "rec.json"
+    rec.write_text(json.dumps({text_key("known note"): {"debridement": 0.9, "aneurysm_repair": 0.1}}))
+    classifier = make_classifier(str(rec))
+    assert classifier("known note", ["debridement", "aneurysm_repair"]) == {"debridement": 0.9, "aneurysm_repair": 0.1}
+    with pytest.raises(KeyError):
+        classifier("unseen note", ["debridement"])
+
+def test_live_backend_fails_loudly_without_key(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    with pytest.raises(Exception):
+        make_classifier("live")("Debridement of foot ulcer.", ["debridement"])